@@ -0,0 +1,247 @@
+"""Watch mode for TestAgent
+
+Keeps one TestAgent alive, with its symbol index, test index, model
+cache and warm pytest worker, and generates and validates tests for
+files as they are saved. A small HTTP API on 127.0.0.1 reports status
+and takes triggers:
+
+    GET  /status    state of the watcher and summary of the latest run
+    POST /trigger   run now; optional JSON body {"files": ["a.py", ...]}
+
+Start it with:
+    python test_agent.py --watch --port 8765
+"""
+
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """Serves the status and trigger endpoints of an AgentDaemon"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._send_json(self.server.daemon.get_status())
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if self.path != "/trigger":
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("body must be a JSON object")
+            files = request.get("files")
+            if files is not None and not (
+                isinstance(files, list) and all(isinstance(f, str) for f in files)
+            ):
+                raise ValueError("files must be a list of paths")
+        except ValueError as e:
+            self._send_json({"error": str(e)}, status=400)
+            return
+
+        self.server.daemon.trigger(files)
+        self._send_json({"queued": files or "all"}, status=202)
+
+
+class AgentDaemon:
+    """Watches a project and runs TestAgent.process_changes() on saves
+
+    Files are polled every interval seconds by mtime and size. Changes
+    are collected for settle seconds before a run starts, so editors
+    that write several files at once cause a single run.
+    """
+
+    def __init__(self, agent, port=8765, interval=1.0, settle=0.3):
+        self.agent = agent
+        self.port = port
+        self.interval = interval
+        self.settle = settle
+        self.server = None
+        self.status = {
+            "state": "starting",
+            "directory": os.path.abspath("."),
+            "runs": 0,
+            "last_run": None,
+            "last_error": None,
+        }
+        # filepath -> (mtime, size) as of the last poll
+        self._snapshot = {}
+        self._pending = set()
+        self._pending_all = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _stat(self, filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def snapshot(self):
+        """Return (mtime, size) of every Python file in the project"""
+        snapshot = {}
+        for filepath in self.agent.list_files(refresh=True):
+            stat = self._stat(filepath)
+            if stat is not None:
+                snapshot[filepath] = stat
+        return snapshot
+
+    def poll(self):
+        """Check the project once, queueing files that changed since the last poll"""
+        snapshot = self.snapshot()
+        with self._lock:
+            changed = {
+                filepath
+                for filepath in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(filepath) != self._snapshot.get(filepath)
+            }
+            self._snapshot = snapshot
+        if changed:
+            print(f"\n👀 Changed: {', '.join(sorted(changed))}")
+            self.trigger(changed)
+        return changed
+
+    def trigger(self, files=None):
+        """Queue a run for files, or for the whole project when files is None"""
+        with self._lock:
+            if files:
+                self._pending.update(os.path.normpath(f) for f in files)
+            else:
+                self._pending_all = True
+        self._wake.set()
+
+    def get_status(self):
+        with self._lock:
+            status = dict(self.status)
+            status["pending"] = "all" if self._pending_all else sorted(self._pending)
+        return status
+
+    def _set_status(self, **values):
+        with self._lock:
+            self.status.update(values)
+
+    def _watch_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"   ⚠️  Polling failed: {str(e)}")
+
+    def _run_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            if self._stop.wait(self.settle):
+                break
+            with self._lock:
+                self._wake.clear()
+                files = None if self._pending_all else self._pending
+                self._pending = set()
+                self._pending_all = False
+                self.status["state"] = "running"
+            if files is not None and not files:
+                self._set_status(state="idle")
+                continue
+
+            started = time.perf_counter()
+            try:
+                summary = self.agent.process_changes(files)
+            except Exception as e:
+                print(f"   ❌ Run failed: {str(e)}")
+                self._set_status(state="idle", last_error=str(e))
+                continue
+
+            with self._lock:
+                # The agent's own writes are not changes to react to
+                for filepath in summary["written_files"]:
+                    self._pending.discard(filepath)
+                    stat = self._stat(filepath)
+                    if stat is not None:
+                        self._snapshot[filepath] = stat
+                summary["duration"] = round(time.perf_counter() - started, 3)
+                self.status.update(
+                    state="idle",
+                    runs=self.status["runs"] + 1,
+                    last_run=summary,
+                    last_error=None,
+                )
+            self._report(summary)
+
+    def _report(self, summary):
+        tests = summary["test_summary"]
+        print(
+            f"\n✅ Run done in {summary['duration']}s: "
+            f"{len(summary['generated_tests'])} tests generated, "
+            f"{tests.get('passed', 0)} passed, {len(summary['failed'])} failed"
+        )
+        for nodeid in summary["failed"]:
+            print(f"   ❌ {nodeid}")
+
+    def start(self):
+        """Start the HTTP API, the watcher and the runner in the background"""
+        if self.agent.warm_up:
+            self.agent.warm_up_model()
+
+        self._snapshot = self.snapshot()
+        self.server = ThreadingHTTPServer(("127.0.0.1", self.port), DaemonHandler)
+        self.server.daemon_threads = True
+        self.server.daemon = self
+        self.port = self.server.server_address[1]
+
+        self._threads = [
+            threading.Thread(target=self.server.serve_forever, daemon=True),
+            threading.Thread(target=self._watch_loop, daemon=True),
+            threading.Thread(target=self._run_loop, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        # Catch up on whatever changed while the daemon was not running
+        self.trigger()
+        print(f"👀 Watching {self.status['directory']}")
+        print(f"🌐 API: http://127.0.0.1:{self.port}/status")
+
+    def serve_forever(self):
+        """Run until interrupted with Ctrl+C"""
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            print("\n👋 Stopping watch mode")
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop the background threads, the HTTP API and the agent's helpers"""
+        self._stop.set()
+        self._wake.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5)
+        self.agent.close()
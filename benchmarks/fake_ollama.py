@@ -0,0 +1,196 @@
+"""Local stand-in for the Ollama HTTP API, used by the benchmarks
+
+Answers /api/chat (streamed or not, including JSON format batches) with
+canned tests and configurable latency, so TestAgent can be benchmarked
+without a real model.
+
+Run standalone with:
+    python benchmarks/fake_ollama.py --port 11435 --latency 0.2
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TEST_NAME_RE = re.compile(r"Test function name: (test_\w+)")
+FUNCTION_RE = re.compile(r"Use function directly by name: ([\w.]+)\(")
+BATCH_RE = re.compile(r"### ([\w.]+) \(test name: (test_\w+)\)")
+
+
+def canned_test(function_name, test_name):
+    """Return a small test that passes for any importable function"""
+    symbol = function_name.split(".")[0]
+    return f"def {test_name}():\n    assert callable({symbol})\n"
+
+
+def canned_reply(prompt, format=None):
+    """Build the reply text the fake model sends for a prompt"""
+    batch = BATCH_RE.findall(prompt)
+    if batch and format == "json":
+        return json.dumps({name: canned_test(name, test) for name, test in batch})
+
+    match = TEST_NAME_RE.search(prompt)
+    if match:
+        test_name = match.group(1)
+        function = FUNCTION_RE.search(prompt)
+        function_name = function.group(1) if function else test_name[len("test_") :]
+        return (
+            "```python\n"
+            + canned_test(function_name, test_name)
+            + "```\n\nThis test checks that the function exists."
+        )
+
+    return "1. Keep tests small.\n2. Cover edge cases.\n3. Run tests in CI."
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Handles the subset of the Ollama API that TestAgent uses"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": self.server.model}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path == "/api/generate":
+            # Used for warm-up requests; nothing to generate
+            self._send_json(self._chunk(request, "", done=True, key="response"))
+            return
+        if self.path != "/api/chat":
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        with self.server.lock:
+            self.server.requests += 1
+
+        prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+        reply = canned_reply(prompt, request.get("format"))
+        tokens = re.findall(r"\S+|\s+", reply)
+        prompt_tokens = (len(prompt) + 3) // 4
+
+        time.sleep(self.server.latency)
+
+        if not request.get("stream", True):
+            time.sleep(self.server.token_latency * len(tokens))
+            self._send_json(
+                self._chunk(request, reply, done=True, prompt_tokens=prompt_tokens)
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(self.server.token_latency)
+                self._write_chunk(self._chunk(request, token))
+            self._write_chunk(
+                self._chunk(
+                    request,
+                    "",
+                    done=True,
+                    prompt_tokens=prompt_tokens,
+                    eval_count=len(tokens),
+                )
+            )
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped the stream early
+            self.close_connection = True
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _chunk(
+        self, request, content, done=False, key="message", prompt_tokens=0, eval_count=0
+    ):
+        chunk = {
+            "model": request.get("model", self.server.model),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "done": done,
+        }
+        if key == "message":
+            chunk["message"] = {"role": "assistant", "content": content}
+        else:
+            chunk[key] = content
+        if done:
+            chunk.update(
+                {
+                    "done_reason": "stop",
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": eval_count or (len(content.split()) if content else 0),
+                }
+            )
+        return chunk
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Threaded fake Ollama server; use as a context manager"""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, token_latency=0.0, model="llama3.2"):
+        super().__init__(("127.0.0.1", port), FakeOllamaHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.model = model
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # Clients that stop streaming early drop the connection
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.port, args.latency, args.token_latency)
+    print(f"Fake Ollama listening on {server.url}")
+    server.serve_forever()
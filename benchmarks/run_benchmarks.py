@@ -0,0 +1,148 @@
+"""End-to-end benchmarks for TestAgent against a fake Ollama server
+
+Generates synthetic projects, runs analyze_project() on each and reports
+throughput (functions/minute), peak Python memory and time per phase.
+Results are compared with stored baselines so regressions show up
+without a real model:
+
+    python benchmarks/run_benchmarks.py --sizes 100 1000
+    python benchmarks/run_benchmarks.py --save-baseline
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_ollama import FakeOllamaServer
+from synthetic import make_project
+from test_agent import TestAgent
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baselines.json")
+
+
+def run_benchmark(functions, latency, token_latency, concurrency):
+    """Run analyze_project() on a synthetic project and return its metrics"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="test_agent_bench_") as project:
+        make_project(project, functions)
+        with FakeOllamaServer(latency=latency, token_latency=token_latency) as server:
+            os.chdir(project)
+            try:
+                agent = TestAgent(
+                    host=server.url, concurrency=concurrency, cache_dir=None
+                )
+                tracemalloc.start()
+                started = time.perf_counter()
+                with open(os.devnull, "w") as devnull:
+                    with contextlib.redirect_stdout(devnull):
+                        agent.analyze_project(
+                            trace_file=os.path.join(project, "trace.json")
+                        )
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                agent.close()
+            finally:
+                os.chdir(cwd)
+            requests = server.requests
+
+    generated = len(agent.report_data["generated_tests"])
+    phases = {}
+    for span in agent.tracer.by_kind("phase"):
+        phases[span["name"]] = phases.get(span["name"], 0.0) + span["duration"]
+
+    return {
+        "functions": functions,
+        "generated": generated,
+        "model_requests": requests,
+        "seconds": round(elapsed, 3),
+        "functions_per_minute": round(generated / elapsed * 60, 1) if elapsed else 0.0,
+        "peak_memory_mb": round(peak / (1024 * 1024), 1),
+        "phases": {name: round(duration, 3) for name, duration in phases.items()},
+    }
+
+
+def compare(result, baseline, tolerance):
+    """Return regression messages for result against its baseline"""
+    problems = []
+    floor = baseline["functions_per_minute"] * (1 - tolerance)
+    if result["functions_per_minute"] < floor:
+        problems.append(
+            f"throughput {result['functions_per_minute']} < {floor:.1f} functions/minute"
+        )
+    ceiling = baseline["peak_memory_mb"] * (1 + tolerance)
+    if result["peak_memory_mb"] > ceiling:
+        problems.append(f"peak memory {result['peak_memory_mb']} > {ceiling:.1f} MB")
+    for name, seconds in result["phases"].items():
+        base = baseline.get("phases", {}).get(name)
+        # Ignore noise on phases that take next to no time
+        if base is not None and seconds > max(base * (1 + tolerance), base + 0.5):
+            problems.append(f"phase {name} took {seconds}s (baseline {base}s)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TestAgent")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    results = {}
+    regressions = []
+    for size in args.sizes:
+        print(f"⏱️  Benchmarking {size} functions...")
+        result = run_benchmark(
+            size, args.latency, args.token_latency, args.concurrency
+        )
+        results[str(size)] = result
+        print(
+            f"   {result['functions_per_minute']} functions/minute, "
+            f"{result['peak_memory_mb']} MB peak, {result['seconds']}s total"
+        )
+        for name, seconds in result["phases"].items():
+            print(f"      {name}: {seconds}s")
+
+        if str(size) in baselines and not args.save_baseline:
+            for problem in compare(result, baselines[str(size)], args.tolerance):
+                print(f"   ❌ Regression: {problem}")
+                regressions.append(f"{size}: {problem}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baselines.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"✅ Baseline saved: {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} performance regressions")
+        return 1
+    print("\n✅ No performance regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
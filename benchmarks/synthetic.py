@@ -0,0 +1,28 @@
+"""Synthetic projects for the benchmarks"""
+
+import os
+
+
+def make_project(directory, functions, per_module=100):
+    """Write a project with the given number of untested functions
+
+    Functions are spread over modules named mod_0000.py, mod_0001.py, ...
+    with at most per_module functions each.
+    """
+    os.makedirs(directory, exist_ok=True)
+    modules = 0
+    for start in range(0, functions, per_module):
+        lines = []
+        for number in range(start, min(start + per_module, functions)):
+            lines.append(
+                f"def func_{number}(a, b):\n"
+                f'    """Combine a and b ({number})"""\n'
+                f"    if b == 0:\n"
+                f'        raise ValueError("b must not be zero")\n'
+                f"    return a * {number % 7 + 1} + b\n"
+            )
+        filename = os.path.join(directory, f"mod_{modules:04d}.py")
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(lines))
+        modules += 1
+    return modules
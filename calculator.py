@@ -1,3 +1,16 @@
+import math
+import operator
+import threading
+from array import array
+from functools import lru_cache
+from itertools import compress, count
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
 def add(a, b):
     return a + b
 
@@ -20,35 +33,245 @@ def power(a, b):
     return a**b
 
 
+# Most recently used factorials, kept so later calls can extend them
+_factorial_cache = {}
+_factorial_lock = threading.Lock()
+_FACTORIAL_CACHE_SIZE = 32
+
+
+def _range_product(lo, hi):
+    # Product of lo..hi-1, multiplied as a balanced tree so both operands
+    # of each big-integer multiply are about the same size
+    if hi <= lo:
+        return 1
+    values = [math.prod(range(i, min(i + 16, hi))) for i in range(lo, hi, 16)]
+    while len(values) > 1:
+        paired = [a * b for a, b in zip(values[::2], values[1::2])]
+        if len(values) % 2:
+            paired.append(values[-1])
+        values = paired
+    return values[0]
+
+
+def _cached_factorial_below(n):
+    # Largest cached m <= n as (m, m!), or None
+    with _factorial_lock:
+        best = max((m for m in _factorial_cache if m <= n), default=None)
+        if best is None:
+            return None
+        value = _factorial_cache.pop(best)
+        _factorial_cache[best] = value
+    return best, value
+
+
+def _remember_factorial(n, value):
+    with _factorial_lock:
+        _factorial_cache.pop(n, None)
+        _factorial_cache[n] = value
+        while len(_factorial_cache) > _FACTORIAL_CACHE_SIZE:
+            del _factorial_cache[next(iter(_factorial_cache))]
+
+
 def factorial(n):
     if n < 0:
         raise ValueError("Negative numbers do not have factorials")
-    if n == 0 or n == 1:
-        return 1
-    return n * factorial(n - 1)
+    return factorials([n])[0]
+
+
+def factorials(ns):
+    # Factorials of all values in ns, in order; each one extends the
+    # previous (or a cached) factorial instead of starting from 1
+    ns = [operator.index(n) for n in ns]
+    if any(n < 0 for n in ns):
+        raise ValueError("Negative numbers do not have factorials")
+
+    results = {}
+    previous, value = _cached_factorial_below(min(ns, default=0)) or (1, 1)
+    for n in sorted(set(ns)):
+        if n > previous:
+            value *= _range_product(previous + 1, n + 1)
+            previous = n
+        results[n] = 1 if n < 2 else value
+    if ns and max(ns) >= 2:
+        _remember_factorial(previous, value)
+    return [results[n] for n in ns]
+
+
+# Element-wise versions for NumPy arrays and buffers. They broadcast like
+# NumPy and write into out= when given, e.g. add_array(a, b, out=a)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for array operations")
+
+
+def add_array(a, b, out=None):
+    _require_numpy()
+    return np.add(np.asarray(a), np.asarray(b), out=out)
+
+
+def subtract_array(a, b, out=None):
+    _require_numpy()
+    return np.subtract(np.asarray(a), np.asarray(b), out=out)
+
+
+def multiply_array(a, b, out=None):
+    _require_numpy()
+    return np.multiply(np.asarray(a), np.asarray(b), out=out)
+
+
+def divide_array(a, b, out=None, on_zero="raise"):
+    # on_zero: "raise" (ValueError, like divide), "nan", or a fill value
+    # to put where the divisor is zero
+    _require_numpy()
+    a, b = np.asarray(a), np.asarray(b)
+    zero = b == 0
+    if on_zero == "raise":
+        if zero.any():
+            raise ValueError("Cannot divide by zero")
+        return np.divide(a, b, out=out)
+
+    fill = np.nan if on_zero == "nan" else on_zero
+    if out is None:
+        dtype = np.divide(np.ones(1, a.dtype), np.ones(1, b.dtype)).dtype
+        out = np.empty(np.broadcast_shapes(a.shape, b.shape), dtype=dtype)
+    np.divide(a, b, out=out, where=~zero)
+    np.copyto(out, fill, where=np.broadcast_to(zero, out.shape))
+    return out
+
+
+def power_array(a, b, out=None):
+    _require_numpy()
+    return np.power(np.asarray(a), np.asarray(b), out=out)
+
+
+# Miller-Rabin with these bases is deterministic for every n < 2^64
+# (and well beyond); larger n get a strong probable-prime answer
+_MILLER_RABIN_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+
+# is_prime_many() looks values below this up in a sieve (1 byte each)
+_SIEVE_LIMIT = 1 << 20
+_SEGMENT_SIZE = 1 << 18
 
 
 def is_prime(n):
     if n < 2:
         return False
-    if n == 2:
-        return True
-    if n % 2 == 0:
-        return False
-    for i in range(3, int(n**0.5) + 1, 2):
-        if n % i == 0:
+    for p in _MILLER_RABIN_BASES:
+        if n % p == 0:
+            return n == p
+
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in _MILLER_RABIN_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
             return False
     return True
 
 
+def _sieve_flags(n):
+    # flags[i] is 1 when i is prime, for 0 <= i <= n
+    flags = bytearray([1]) * (n + 1)
+    flags[: min(2, n + 1)] = bytes(min(2, n + 1))
+    for p in range(2, math.isqrt(n) + 1):
+        if flags[p]:
+            flags[p * p :: p] = bytes(len(range(p * p, n + 1, p)))
+    return flags
+
+
+@lru_cache(maxsize=1)
+def _small_prime_table():
+    return _sieve_flags(_SIEVE_LIMIT - 1)
+
+
+def _primes_between(lo, hi):
+    # Primes in [lo, hi), sieved one fixed-size segment at a time
+    lo = max(lo, 2)
+    if hi <= lo:
+        return
+    base = list(compress(count(), _sieve_flags(math.isqrt(hi - 1))))
+    for start in range(lo, hi, _SEGMENT_SIZE):
+        end = min(start + _SEGMENT_SIZE, hi)
+        segment = bytearray([1]) * (end - start)
+        for p in base:
+            if p * p >= end:
+                break
+            first = max(p * p, (start + p - 1) // p * p)
+            segment[first - start :: p] = bytes(len(range(first, end, p)))
+        yield from compress(range(start, end), segment)
+
+
+def primes_up_to(n):
+    # All primes <= n as a compact array of unsigned 64-bit integers
+    return array("Q", _primes_between(2, operator.index(n) + 1))
+
+
+def is_prime_many(values):
+    # Yields is_prime(n) for each value; small values come from a sieve
+    table = _small_prime_table()
+    for n in values:
+        if 0 <= n < _SIEVE_LIMIT:
+            yield bool(table[n])
+        else:
+            yield is_prime(n)
+
+
+def _fibonacci_pair(n):
+    # Fast doubling: F(2k) = F(k) * (2F(k+1) - F(k)), F(2k+1) = F(k)^2 + F(k+1)^2
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        a, b = a * (2 * b - a), a * a + b * b
+        if bit == "1":
+            a, b = b, a + b
+    return a, b
+
+
+# Pairs for n above this are only computed, never memoized, so the memo
+# stays small (F(10000) has about 7000 bits)
+FIBONACCI_MEMO_MAX_N = 10000
+_fibonacci_memo = lru_cache(maxsize=256)(_fibonacci_pair)
+
+
+def set_fibonacci_memo(maxsize):
+    # Resize the memo of (F(n), F(n+1)) pairs; 0 turns it off
+    global _fibonacci_memo
+    _fibonacci_memo = lru_cache(maxsize=maxsize)(_fibonacci_pair) if maxsize else None
+
+
+def _fibonacci_pair_memo(n):
+    memo = _fibonacci_memo
+    if memo is None or n > FIBONACCI_MEMO_MAX_N:
+        return _fibonacci_pair(n)
+    return memo(n)
+
+
 def fibonacci(n):
     if n < 0:
         raise ValueError("Index cannot be negative")
-    if n == 0:
-        return 0
-    if n == 1:
-        return 1
-    return fibonacci(n - 1) + fibonacci(n - 2)
+    return _fibonacci_pair_memo(operator.index(n))[0]
+
+
+def fibonacci_range(start, stop):
+    # Yields fibonacci(start), ..., fibonacci(stop - 1)
+    if start < 0:
+        raise ValueError("Index cannot be negative")
+    if stop <= start:
+        return
+    a, b = _fibonacci_pair_memo(operator.index(start))
+    for _ in range(operator.index(stop) - start):
+        yield a
+        a, b = b, a + b
 
 
 def gcd(a, b):
@@ -62,3 +285,70 @@ def lcm(a, b):
     if a == 0 or b == 0:
         return 0
     return abs(a * b) // gcd(a, b)
+
+
+# Chunk size for gcd_many() on NumPy arrays, so it can stop at gcd 1
+_GCD_CHUNK = 4096
+
+
+def _is_int_array(values):
+    return np is not None and isinstance(values, np.ndarray) and values.dtype.kind in "iu"
+
+
+def gcd_many(values):
+    # gcd of all values; stops reading as soon as the gcd is 1
+    if _is_int_array(values):
+        values = values.ravel()
+        result = 0
+        for start in range(0, values.size, _GCD_CHUNK):
+            chunk = values[start : start + _GCD_CHUNK]
+            result = math.gcd(result, int(np.gcd.reduce(chunk)))
+            if result == 1:
+                break
+        return result
+
+    result = 0
+    for value in values:
+        result = math.gcd(result, value)
+        if result == 1:
+            break
+    return result
+
+
+def _lcm_tree(values):
+    # Pairwise reduction keeps both operands of each step about the same size
+    while len(values) > 1:
+        paired = [a // math.gcd(a, b) * b for a, b in zip(values[::2], values[1::2])]
+        if len(values) % 2:
+            paired.append(values[-1])
+        values = paired
+    return values[0] if values else 1
+
+
+def lcm_many(values):
+    # lcm of all values; like lcm(), any zero makes the result 0
+    if _is_int_array(values):
+        # Work in 64 bits whatever the input width, so narrow dtypes can't wrap
+        wide = np.uint64 if values.dtype.kind == "u" else np.int64
+        values = np.abs(values.ravel().astype(wide))
+        if (values == 0).any():
+            return 0
+        largest = np.iinfo(wide).max
+        while values.size > 1:
+            if values.size % 2:
+                values = np.append(values, values.dtype.type(1))
+            a, b = values[0::2], values[1::2]
+            a = a // np.gcd(a, b)
+            # lcm = a // gcd * b; finish in Python once a pair would overflow
+            if (a > largest // b).any():
+                break
+            values = a * b
+        else:
+            return int(values[0]) if values.size else 1
+        values = values.tolist()
+
+    values = [abs(operator.index(value)) for value in values]
+    if 0 in values:
+        return 0
+    return _lcm_tree(values)
+
@@ -0,0 +1,151 @@
+"""Long-lived pytest worker that keeps the code under test imported
+
+TestAgent starts this file as a child process and sends one JSON request
+per line on stdin: {"args": [...]} with the pytest arguments. The worker
+answers each request with one JSON line: {"returncode": int, "output": str}.
+
+Third-party packages stay imported between runs. When any project module
+changed since the previous run, all project modules are dropped from
+sys.modules, so pytest imports the new code and nothing keeps a reference
+to the old one.
+"""
+
+import io
+import os
+import sys
+import json
+import threading
+import importlib
+import contextlib
+import subprocess
+
+
+def _project_modules(root):
+    """Yield (name, path) of loaded modules whose file lives under root"""
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if not path or name == "__main__":
+            continue
+        path = os.path.abspath(path)
+        if path.startswith(root) and os.sep + "site-packages" + os.sep not in path:
+            yield name, path
+
+
+def _drop_changed_modules(root, mtimes):
+    """Forget project modules if any of their files changed since import"""
+    modules = list(_project_modules(root))
+    for _, path in modules:
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtimes.get(path) != mtime:
+            break
+    else:
+        return
+
+    # Other project modules may hold references into the changed one
+    for name, _ in modules:
+        del sys.modules[name]
+    mtimes.clear()
+    importlib.invalidate_caches()
+
+
+def _record_mtimes(root, mtimes):
+    for _, path in _project_modules(root):
+        if path not in mtimes:
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                pass
+
+
+def serve():
+    """Answer pytest requests from stdin until it is closed"""
+    import pytest
+
+    root = os.path.abspath(os.getcwd()) + os.sep
+    if root.rstrip(os.sep) not in sys.path:
+        sys.path.insert(0, root.rstrip(os.sep))
+
+    # Keep the real stdout for responses and send stray writes to stderr
+    channel = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+
+    mtimes = {}
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        _drop_changed_modules(root, mtimes)
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            try:
+                returncode = int(pytest.main(request["args"]))
+            except Exception as e:
+                print(f"Worker error: {str(e)}")
+                returncode = 3
+
+        _record_mtimes(root, mtimes)
+        channel.write(json.dumps({"returncode": returncode, "output": output.getvalue()}))
+        channel.write("\n")
+        channel.flush()
+
+
+class PytestWorker:
+    """Handle to a warm pytest worker process"""
+
+    def __init__(self, cwd="."):
+        self.cwd = cwd
+        self.process = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker process if it is not running"""
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__)],
+                cwd=self.cwd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding="utf-8",
+            )
+        return self.process
+
+    def run(self, args, timeout=60):
+        """Run pytest with args in the worker, returning (returncode, output)"""
+        with self._lock:
+            process = self.start()
+            process.stdin.write(json.dumps({"args": list(args)}) + "\n")
+            process.stdin.flush()
+
+            response = []
+            reader = threading.Thread(
+                target=lambda: response.append(process.stdout.readline()),
+                daemon=True,
+            )
+            reader.start()
+            reader.join(timeout)
+
+            if not response or not response[0]:
+                # Hung or crashed; the next run starts a fresh worker
+                self.close()
+                raise RuntimeError("pytest worker did not respond")
+
+        result = json.loads(response[0])
+        return result["returncode"], result["output"]
+
+    def close(self):
+        """Stop the worker process"""
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            self.process = None
+
+
+if __name__ == "__main__":
+    serve()
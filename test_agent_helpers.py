@@ -0,0 +1,257 @@
+import os
+import json
+import pytest
+from test_agent import TestAgent
+
+
+@pytest.fixture
+def agent():
+    return TestAgent(cache_dir=None, warm_up=False)
+
+
+def test_required_imports(agent):
+    code = "def test_total():\n    assert total([1, 2]) == 3\n    assert len(helper()) == 0\n"
+    assert agent._required_imports(code, {"total", "unused"}) == (
+        {"total"},
+        False,
+        {"helper"},
+    )
+
+
+def test_required_imports_shadowed_builtin(agent):
+    code = "def test_sum():\n    assert sum([1, 2]) == 3\n    assert max(1, 2) == 2\n"
+    module_imports, uses_pytest, unresolved = agent._required_imports(code, {"sum"})
+    assert module_imports == {"sum"}
+    assert uses_pytest is False
+    assert unresolved == set()
+
+
+def test_required_imports_pytest_and_locals(agent):
+    code = (
+        "def test_divide(tmp_path):\n"
+        "    x = 1\n"
+        "    with pytest.raises(ValueError) as error:\n"
+        "        divide(x, 0)\n"
+        "    assert [i for i in range(3)]\n"
+    )
+    assert agent._required_imports(code, {"divide"}) == ({"divide"}, True, set())
+    assert agent._required_imports("def test_x(:\n", {"x"}) == (set(), False, set())
+
+
+def test_merge_imports_extends_existing_import(agent):
+    content = '"""Tests"""\nimport os\nfrom stats import mean as m, median\n\n\ndef test_mean():\n    assert m([1]) == 1\n'
+    merged, added = agent._merge_imports(content, "stats", {"sum", "median"}, True)
+    assert added == ["sum", "pytest"]
+    assert merged.splitlines()[:4] == [
+        '"""Tests"""',
+        "import os",
+        "from stats import mean as m, median, sum",
+        "import pytest",
+    ]
+    assert merged.endswith("assert m([1]) == 1\n")
+
+
+def test_merge_imports_new_file_and_docstring(agent):
+    merged, added = agent._merge_imports("", "pkg.stats", {"sum", "mean"}, False)
+    assert added == ["mean", "sum"]
+    assert merged == "from pkg.stats import mean, sum\n"
+
+    merged, _ = agent._merge_imports('"""Docs"""\n', "stats", {"sum"}, True)
+    assert merged == '"""Docs"""\nimport pytest\nfrom stats import sum\n'
+
+
+def test_merge_imports_nothing_missing(agent):
+    content = "import pytest\nfrom stats import sum\n"
+    assert agent._merge_imports(content, "stats", {"sum"}, True) == (content, [])
+
+
+def write_file(path, content):
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+def test_is_tested_prefix_needs_a_reference(agent, tmp_path):
+    test_file = write_file(
+        tmp_path / "test_shop.py",
+        "def test_add_item():\n    basket.add_item(1)\n\n\n"
+        "def test_other():\n    s = set()\n    s.add(1)\n\n\n"
+        "def test_total_empty():\n    assert total([]) == 0\n\n\n"
+        "def test_Box_size_empty():\n    assert Box().size() == 0\n",
+    )
+    agent.build_test_index([test_file])
+    assert not agent.is_tested("add")
+    assert agent.is_tested("total")
+    assert agent.is_tested("Box.size")
+    assert agent.is_tested("add_item")
+    assert not agent.is_tested("Crate.size")
+
+
+def test_build_test_context_stays_in_budget(agent, tmp_path):
+    tests = "".join(
+        f"def test_add_case_{i}():\n    assert add({i}, 1) == {i + 1}\n\n\n"
+        for i in range(400)
+    )
+    agent.context_tokens = 300
+    agent.build_test_index([write_file(tmp_path / "test_math.py", tests)])
+    context = agent.build_test_context("add")
+    assert (len(context) + 3) // 4 <= 300
+    assert context.startswith("Tests: test_add_case_0, test_add_case_1,")
+    assert "more tests" in context
+    assert "assert add(0, 1) == 1" in context
+    assert agent.build_test_context("subtract") == "None"
+
+
+SHOP = (
+    "import math\n\n\n"
+    "class OutOfStock(Exception):\n    pass\n\n\n"
+    "TAX = 2\n\n\n"
+    "def buy(n):\n    if n == 0:\n        raise OutOfStock()\n    return n + TAX\n"
+)
+SHOP_TEST = (
+    "def test_buy():\n"
+    "    with pytest.raises(OutOfStock):\n"
+    "        buy(0)\n"
+    "    assert buy(1) == 1 + TAX\n"
+    "    assert math.isclose(buy(1), 3)\n"
+)
+
+
+def test_write_module_tests_imports_classes_and_constants(agent, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_file(tmp_path / "shop.py", SHOP)
+    write_file(tmp_path / "test_shop.py", "import math\n")
+    agent._write_module_tests(
+        "test_shop.py", [{"function": "buy", "file": "shop.py", "test_code": SHOP_TEST}]
+    )
+    content = (tmp_path / "test_shop.py").read_text(encoding="utf-8")
+    assert "from shop import OutOfStock, TAX, buy\n" in content
+    assert "import pytest\n" in content
+    assert "from shop import math" not in content
+
+
+def test_merge_imports_multiline_import(agent):
+    content = (
+        "from stats import (\n    mean,\n    median,\n)\nimport os\n\n\n"
+        "def test_mean():\n    assert mean([1]) == 1\n"
+    )
+    merged, added = agent._merge_imports(content, "stats", {"sum"}, True)
+    assert added == ["sum", "pytest"]
+    assert merged.splitlines()[:7] == [
+        "from stats import (",
+        "    mean,",
+        "    median,",
+        "    sum,",
+        ")",
+        "import os",
+        "import pytest",
+    ]
+    assert merged.endswith("def test_mean():\n    assert mean([1]) == 1\n")
+
+
+def test_module_name_for_packages(tmp_path, monkeypatch):
+    from test_agent import module_name_for
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "src" / "pkg" / "sub").mkdir(parents=True)
+    (tmp_path / "src" / "pkg" / "__init__.py").touch()
+    (tmp_path / "src" / "pkg" / "sub" / "__init__.py").touch()
+    assert module_name_for("calc.py") == "calc"
+    assert module_name_for(os.path.join("src", "pkg", "mod.py")) == "pkg.mod"
+    assert module_name_for(os.path.join("src", "pkg", "sub", "mod.py")) == "pkg.sub.mod"
+    assert module_name_for(os.path.join("src", "plain.py")) == "plain"
+
+
+def test_known_names_pass_the_gate(agent, tmp_path, monkeypatch):
+    from test_agent import check_test_code
+
+    monkeypatch.chdir(tmp_path)
+    write_file(tmp_path / "shop.py", SHOP.replace("import math\n", ""))
+    write_file(tmp_path / "test_shop.py", "import math\n")
+    known_names = agent._known_names("shop.py")
+    assert check_test_code(SHOP_TEST, known_names, "test_buy") == []
+    assert check_test_code(SHOP_TEST, {"buy"}, "test_buy") == [
+        "undefined name: OutOfStock",
+        "undefined name: TAX",
+        "undefined name: math",
+    ]
+
+
+def test_fix_loop_leaves_hand_written_tests_alone(agent, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_file(tmp_path / "mod_a.py", "def alpha(x):\n    return x + 1\n")
+    test_source = "from mod_a import alpha\n\n\ndef test_alpha():\n    assert alpha(1) == 3\n"
+    write_file(tmp_path / "test_mod_a.py", test_source)
+
+    def no_chat(*args, **kwargs):
+        raise AssertionError("the model must not be asked")
+
+    agent._chat = no_chat
+    assert agent.validate_and_fix_tests(node_ids=[]) is True
+    assert agent.last_session is None
+    assert agent.validate_and_fix_tests() is False
+    assert (tmp_path / "test_mod_a.py").read_text(encoding="utf-8") == test_source
+
+
+def test_agent_ignores_only_the_agents_own_files(agent, tmp_path, monkeypatch):
+    import test_agent
+
+    assert f"--ignore={os.path.abspath(test_agent.__file__)}" in agent._agent_ignores()
+    monkeypatch.chdir(tmp_path)
+    write_file(tmp_path / "test_agent.py", "def test_mine():\n    assert True\n")
+    assert agent._agent_ignores() == []
+
+
+class FakeLLM:
+    """Stands in for LLMClient, recording every request"""
+
+    STATS = {
+        "prompt_tokens": 1,
+        "tokens": 1,
+        "ttft": 0.0,
+        "duration": 0.0,
+        "tokens_per_sec": 0.0,
+        "stopped_early": False,
+        "load_duration": 0.0,
+        "cold": False,
+    }
+
+    def __init__(self):
+        self.calls = []
+        self.warm = False
+
+    def warm_up(self):
+        self.calls.append("warm_up")
+        self.warm = True
+        return {"duration": 0.0, "load_duration": 0.0}
+
+    def chat(self, prompt, options, stop_when=None, format=None):
+        self.calls.append("chat")
+        if format == "json":
+            reply = {"add": "def test_add():\n    assert add(1, 2) == 3\n"}
+            return json.dumps(reply), self.STATS
+        if "def sub(" in prompt:
+            return "def test_sub():\n    assert sub(2, 1) == 1\n", self.STATS
+        return "Looks fine.", self.STATS
+
+
+def test_unchanged_project_needs_no_model_calls(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_file(
+        tmp_path / "mathx.py",
+        "def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n",
+    )
+
+    runs = []
+    for _ in range(3):
+        agent = TestAgent(cache_dir=str(tmp_path / "cache"), batch_size=2)
+        agent.llm = FakeLLM()
+        agent.analyze_project(trace_file=str(tmp_path / "trace.json"))
+        runs.append((agent.llm.calls, agent.cache.stats()))
+
+    # add comes from the batch, sub from the single prompt retry; each
+    # function, the analysis and the recommendations miss exactly once
+    assert runs[0] == (["warm_up"] + ["chat"] * 4, {"hits": 0, "misses": 4})
+    # The written tests change the test results, so only the analysis
+    # is asked again; the recommendations for the same analysis are cached
+    assert runs[1] == (["warm_up", "chat"], {"hits": 1, "misses": 1})
+    assert runs[2] == ([], {"hits": 2, "misses": 0})
@@ -1,5 +1,6 @@
+import math
 import pytest
-from calculator import ValueError, add, divide, factorial, fibonacci, gcd, is_prime, lcm, multiply, power, subtract
+from calculator import add, add_array, divide, divide_array, factorial, factorials, fibonacci, fibonacci_range, gcd, gcd_many, is_prime, is_prime_many, lcm, lcm_many, multiply, multiply_array, power, power_array, primes_up_to, subtract, subtract_array
 
 
 # ========================================
@@ -106,3 +107,158 @@ def test_lcm():
     with pytest.raises(ValueError):
         lcm(-1, -0)
 
+
+def test_fibonacci_large():
+    a, b = 0, 1
+    for n in range(300):
+        assert fibonacci(n) == a
+        a, b = b, a + b
+    for _ in range(700):
+        a, b = b, a + b
+    assert fibonacci(1000) == a
+    assert fibonacci(100000).bit_length() == 69424
+    with pytest.raises(TypeError):
+        fibonacci(2.5)
+
+def test_fibonacci_range():
+    assert list(fibonacci_range(0, 10)) == [0, 1, 1, 2, 3, 5, 8, 13, 21, 34]
+    assert list(fibonacci_range(50, 53)) == [fibonacci(50), fibonacci(51), fibonacci(52)]
+    assert list(fibonacci_range(5, 5)) == []
+    assert list(fibonacci_range(5, 2)) == []
+    with pytest.raises(ValueError):
+        list(fibonacci_range(-1, 3))
+
+def test_factorial_large():
+    assert factorial(2000) == math.factorial(2000)
+    assert factorial(2050) == math.factorial(2050)
+    assert factorial(1999) == math.factorial(1999)
+    with pytest.raises(TypeError):
+        factorial(2.5)
+
+def test_factorials():
+    assert factorials([5, 0, 3, 10, 3, 1]) == [120, 1, 6, 3628800, 6, 1]
+    assert factorials([]) == []
+    assert factorials([700, 300]) == [factorial(700), factorial(300)]
+    with pytest.raises(ValueError):
+        factorials([3, -1])
+
+def test_is_prime_large():
+    assert is_prime(2**61 - 1) == True
+    assert is_prime(18446744073709551557) == True
+    assert is_prime(18446744073709551559) == False
+    # Strong pseudoprimes to several small bases
+    assert is_prime(2047) == False
+    assert is_prime(3215031751) == False
+    assert is_prime(3825123056546413051) == False
+    assert is_prime(561) == False
+
+def test_primes_up_to():
+    assert list(primes_up_to(30)) == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    assert list(primes_up_to(1)) == []
+    assert list(primes_up_to(2)) == [2]
+    primes = primes_up_to(1000000)
+    assert len(primes) == 78498
+    assert primes[-1] == 999983
+
+def test_is_prime_many():
+    values = list(range(-5, 5000)) + [2**61 - 1, 2**61 + 1]
+    assert list(is_prime_many(values)) == [is_prime(n) for n in values]
+    assert list(is_prime_many([])) == []
+    with pytest.raises(TypeError):
+        list(is_prime_many(["text"]))
+
+def test_array_arithmetic():
+    np = pytest.importorskip("numpy")
+    a = np.array([1.0, 2.0, 3.0])
+    b = np.array([[1.0], [2.0]])
+    assert add_array(a, b).tolist() == [[2.0, 3.0, 4.0], [3.0, 4.0, 5.0]]
+    assert subtract_array(a, 1).tolist() == [0.0, 1.0, 2.0]
+    assert multiply_array([1, 2, 3], [2, 2, 2]).tolist() == [2, 4, 6]
+    assert power_array(a, 2).tolist() == [1.0, 4.0, 9.0]
+    assert add_array(memoryview(bytes([1, 2])), 1).tolist() == [2, 3]
+
+    out = add_array(a, 1, out=a)
+    assert out is a
+    assert a.tolist() == [2.0, 3.0, 4.0]
+
+def test_divide_array():
+    np = pytest.importorskip("numpy")
+    a = np.array([1.0, 4.0, -6.0])
+    assert divide_array(a, 2).tolist() == [0.5, 2.0, -3.0]
+    with pytest.raises(ValueError):
+        divide_array(a, [1, 0, 2])
+    result = divide_array(a, [1, 0, 2], on_zero="nan")
+    assert result[0] == 1.0 and np.isnan(result[1]) and result[2] == -3.0
+    assert divide_array([1, 4, 6], [1, 0, 2], on_zero=0).tolist() == [1.0, 0.0, 3.0]
+
+    out = np.empty(3)
+    assert divide_array(a, [2, 0, 2], out=out, on_zero=-1) is out
+    assert out.tolist() == [0.5, -1.0, -3.0]
+
+def test_gcd_many():
+    assert gcd_many([12, 18, 24]) == 6
+    assert gcd_many([-12, 18]) == 6
+    assert gcd_many([0, 15]) == 15
+    assert gcd_many([]) == 0
+    assert gcd_many(iter([4, 7] + ["never read"])) == 1
+    assert gcd_many([2**70, 2**65 * 3]) == 2**65
+    with pytest.raises(TypeError):
+        gcd_many(["a", 15])
+
+def test_lcm_many():
+    assert lcm_many([4, 6, 10]) == 60
+    assert lcm_many([-3, 4]) == 12
+    assert lcm_many([0, 5]) == 0
+    assert lcm_many([7]) == 7
+    assert lcm_many([]) == 1
+    assert lcm_many(range(1, 21)) == 232792560
+    assert lcm_many(range(1, 101)) == math.lcm(*range(1, 101))
+
+def test_gcd_lcm_many_numpy():
+    np = pytest.importorskip("numpy")
+    values = np.arange(6, 60000, 6, dtype=np.int64)
+    assert gcd_many(values) == 6
+    assert gcd_many(np.array([[12, 18], [24, 30]], dtype=np.uint32)) == 6
+    assert gcd_many(np.array([], dtype=np.int64)) == 0
+    assert lcm_many(np.array([4, 6, 10], dtype=np.int32)) == 60
+    assert lcm_many(np.array([4, 0, 10])) == 0
+    # Results wider than the input dtype must not wrap
+    assert lcm_many(np.array([65536, 65537], dtype=np.int32)) == 4295032832
+    assert lcm_many(np.array([300, 301], dtype=np.int16)) == 90300
+    assert lcm_many(np.array([300, 301, 7], dtype=np.int16)) == 90300
+    assert lcm_many(np.array([250, 251, 3], dtype=np.uint8)) == 188250
+    assert lcm_many(np.full(200000, 6)) == 6
+    assert lcm_many(np.arange(200000) % 50 + 1) == math.lcm(*range(1, 51))
+    assert lcm_many(np.array([2**62, 3])) == 3 * 2**62
+    # Too big for int64, so computed with Python integers
+    assert lcm_many(np.arange(1, 101)) == math.lcm(*range(1, 101))
+
+def test_factorial_threads():
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+    values = [n % 59 + 2 for n in range(20000)]
+    interval = sys.getswitchinterval()
+    # Switch threads as often as possible to expose races on the cache
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(factorial, values))
+    finally:
+        sys.setswitchinterval(interval)
+    assert results == [math.factorial(n) for n in values]
+
+def test_fibonacci_memo():
+    import calculator
+    try:
+        calculator.set_fibonacci_memo(0)
+        assert fibonacci(90) == 2880067194370816120
+        calculator.set_fibonacci_memo(4)
+        # Large pairs are never kept
+        fibonacci(calculator.FIBONACCI_MEMO_MAX_N + 1)
+        assert calculator._fibonacci_memo.cache_info().currsize == 0
+        for n in range(10):
+            fibonacci(n)
+        assert calculator._fibonacci_memo.cache_info().currsize == 4
+    finally:
+        calculator.set_fibonacci_memo(256)
+    assert list(fibonacci_range(0, 5)) == [0, 1, 1, 2, 3]